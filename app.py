@@ -7,6 +7,9 @@
 # - Colonne "ID" (issue de l’Excel) dans Excel & PDF
 # - Suppression "Fiches récupérées ?"
 # - Vérification I3/I4+, mêmes règles/exclusions/tri/exports
+# - Détection des doublons (même ID / même Nom-Prénom) et des conflits de classes
+# - Liste d'exclusion configurable (Nom;Prénom ou ID) au lieu de l'exclusion codée en dur
+# - Tri des listes à la française (clé de collation et tri global calculés une fois par fichier)
 
 # ==== IMPORTANT : désactiver le watcher AVANT d'importer streamlit ====
 import os
@@ -17,6 +20,7 @@ import re
 from typing import List, Tuple, Dict, Any, Optional, Set
 from collections import defaultdict
 import io
+import hashlib
 import unicodedata
 from datetime import datetime
 
@@ -166,15 +170,165 @@ def parse_numeros(groupes_str: Any) -> List[int]:
         return []
     return [int(m.group(0)) for m in NUM_RE.finditer(str(groupes_str))]
 
-# ====== helpers : exclusion "Salomé Galbois" (sans accent/casse) ======
-def _normalize(s: str) -> str:
-    s = (s or "").strip()
-    s = unicodedata.normalize("NFKD", s)
-    s = "".join(ch for ch in s if not unicodedata.combining(ch))
-    return s.lower()
+# ====== helpers : normalisation (sans accent/casse) ======
+# Marques combinantes (accents) retirées après NFKD
+COMBINING_RE = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+def normaliser_serie(s: pd.Series) -> pd.Series:
+    """Normalisation vectorisée d'une colonne (NaN -> "") : seule implémentation,
+    utilisée pour les données comme pour la liste d'exclusion."""
+    return (s.fillna("").astype(str).str.strip()
+             .str.normalize("NFKD")
+             .str.replace(COMBINING_RE, "", regex=True)
+             .str.lower())
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cles_normalisees(upload_key: str, col: str, _s: pd.Series) -> pd.Series:
+    """normaliser_serie mise en cache par fichier chargé (empreinte complète des octets) et par colonne.
+    La série elle-même n'est pas hachée (préfixe _) : seule la clé compte."""
+    return normaliser_serie(_s)
+
+def cle_nom_prenom(nom_k: pd.Series, prenom_k: pd.Series) -> pd.Series:
+    return nom_k + "\x1f" + prenom_k
+
+# ============================= DOUBLONS =============================
+DIAG_DOUBLON_CONFLIT = "Doublon avec classes différentes"
+DIAG_DOUBLON_ID = "Doublon (même ID)"
+DIAG_DOUBLON_NOM = "Doublon (même Nom/Prénom)"
+
+def normaliser_ids(s: pd.Series) -> pd.Series:
+    """IDs en texte comparable ("123.0" lu par Excel -> "123") ; vide -> NA."""
+    ids = s.astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+    return ids.mask(ids == "")
+
+def signature_classes(groupes_str: Any) -> str:
+    return ",".join(str(n) for n in sorted({n for n in parse_numeros(groupes_str) if n in CLASS_NAMES}))
+
+def detecter_doublons(df: pd.DataFrame, groupes_col: str, id_col: Optional[str],
+                      nom_k: Optional[pd.Series], prenom_k: Optional[pd.Series]) -> pd.Series:
+    """Doublons par ID et par Nom/Prénom normalisés, via index de hachage (groupby) : coût linéaire.
+    Un groupe Nom/Prénom contenant plusieurs IDs différents = homonymes, pas un doublon."""
+    out = pd.Series("", index=df.index, dtype=object)
+    conflit = pd.Series(False, index=df.index)
+    sig = df[groupes_col].map(signature_classes)
+
+    index_keys: List[Tuple[pd.Series, str]] = []
+    ids = normaliser_ids(df[id_col]) if id_col and id_col in df.columns else None
+    if ids is not None:
+        index_keys.append((ids, DIAG_DOUBLON_ID))
+    if nom_k is not None and prenom_k is not None:
+        name_key = cle_nom_prenom(nom_k, prenom_k).mask((nom_k == "") | (prenom_k == ""))
+        if ids is not None:
+            n_ids = ids.groupby(name_key).transform("nunique")
+            name_key = name_key.mask(n_ids > 1)
+        index_keys.append((name_key, DIAG_DOUBLON_NOM))
+
+    for key, label in index_keys:
+        dup = key.notna() & key.duplicated(keep=False)
+        if not dup.any():
+            continue
+        out[dup & (out == "")] = label
+        n_sig = sig[dup].groupby(key[dup]).transform("nunique")
+        conflit |= (n_sig > 1).reindex(df.index, fill_value=False)
+    out[conflit] = DIAG_DOUBLON_CONFLIT
+    return out
 
-def is_salome_galbois(nom: str, prenom: str) -> bool:
-    return _normalize(nom) == "galbois" and _normalize(prenom) == "salome"
+# ============================= EXCLUSIONS =============================
+# Une exclusion par ligne : "Nom;Prénom" ou un ID seul. Fichier optionnel à côté de app.py.
+EXCLUSIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exclusions.txt")
+DEFAULT_EXCLUSIONS = "Galbois;Salomé"
+
+def lire_exclusions_defaut() -> str:
+    try:
+        with open(EXCLUSIONS_FILE, encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return DEFAULT_EXCLUSIONS
+
+def charger_exclusions(texte: str) -> Tuple[Set[str], Set[str]]:
+    """Parse la liste d'exclusion et la normalise une seule fois -> (clés Nom/Prénom, IDs).
+    Même normalisation que les colonnes de données (normaliser_serie / normaliser_ids)."""
+    paires: List[Tuple[str, str]] = []
+    ids: List[str] = []
+    for line in (texte or "").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if ";" in line:
+            nom, prenom = line.split(";", 1)
+            paires.append((nom, prenom))
+        else:
+            ids.append(line)
+    noms_k = cle_nom_prenom(normaliser_serie(pd.Series([p[0] for p in paires], dtype=object)),
+                            normaliser_serie(pd.Series([p[1] for p in paires], dtype=object)))
+    ids_k = normaliser_ids(pd.Series(ids, dtype=object)).dropna()
+    return set(noms_k), set(ids_k)
+
+def masque_exclusion(data: pd.DataFrame, id_col: Optional[str], nom_k: Optional[pd.Series],
+                     prenom_k: Optional[pd.Series], exclusions: Tuple[Set[str], Set[str]]) -> pd.Series:
+    noms, ids = exclusions
+    mask = pd.Series(False, index=data.index)
+    if noms and nom_k is not None and prenom_k is not None:
+        mask |= cle_nom_prenom(nom_k, prenom_k).isin(noms)
+    if ids and id_col:
+        mask |= normaliser_ids(data[id_col]).isin(ids).fillna(False).astype(bool)
+    return mask
+
+# ============================= LISTES PAR CLASSE =============================
+def colonne_texte(data: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    if not col:
+        return pd.Series("", index=data.index, dtype=object)
+    return data[col].fillna("").astype(str)
+
+# Ligatures non décomposées par NFKD : "Œ" se classe comme "OE" en français
+LIGATURES = {"œ": "oe", "æ": "ae", "ß": "ss"}
+# Ignorés au premier niveau (ordre du dictionnaire) : "de la Tour" ~ "Delatour", "O'Neil" ~ "Oneil"
+SEPARATEURS_RE = re.compile(r"[\s'’\-]")
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cle_collation(upload_key: str, col: str, _s: pd.Series) -> pd.Series:
+    """Clé de tri française ("Élodie" avant "Zoé") : sans accent ni casse, ligatures développées,
+    espaces/traits d'union/apostrophes ignorés. Calculée une fois par fichier chargé et par colonne."""
+    key = cles_normalisees(upload_key, col, _s)
+    for lig, repl in LIGATURES.items():
+        key = key.str.replace(lig, repl, regex=False)
+    return key.str.replace(SEPARATEURS_RE, "", regex=True)
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def ordre_collation(upload_key: str, nom_col: Optional[str], prenom_col: Optional[str],
+                    _data: pd.DataFrame) -> pd.Index:
+    """Ordre global des lignes (Nom puis Prénom) : un seul tri par fichier et par choix de colonnes."""
+    vide = pd.Series("", index=_data.index, dtype=object)
+    nom_s, prenom_s = colonne_texte(_data, nom_col), colonne_texte(_data, prenom_col)
+    # À clé égale, la forme brute départage ("Elodie" < "Élodie")
+    return pd.DataFrame({
+        "nom": cle_collation(upload_key, nom_col, _data[nom_col]) if nom_col else vide,
+        "prenom": cle_collation(upload_key, prenom_col, _data[prenom_col]) if prenom_col else vide,
+        "nom_brut": nom_s.str.lower(),
+        "prenom_brut": prenom_s.str.lower(),
+    }).sort_values(["nom", "prenom", "nom_brut", "prenom_brut"], kind="stable").index
+
+def construire_classes(data: pd.DataFrame, groupes_col: str, id_col: Optional[str], nom_col: Optional[str],
+                       prenom_col: Optional[str], tel_col: Optional[str],
+                       nom_k: Optional[pd.Series], prenom_k: Optional[pd.Series], ordre: pd.Index,
+                       exclusions: Tuple[Set[str], Set[str]]) -> Dict[int, list]:
+    """classes -> étudiants (ID, Nom, Prénom, Téléphone), hors exceptions et exclusions.
+    nom_k / prenom_k : colonnes Nom/Prénom déjà normalisées (cles_normalisees).
+    ordre : tri global des lignes (ordre_collation) ; chaque classe hérite de cet ordre."""
+    nums = data[groupes_col].map(parse_numeros)
+    has_exception = nums.map(lambda ns: any(n in EXCEPTION_OK_IF_CLASS_ONLY for n in ns))
+    cls = nums.map(lambda ns: {n for n in ns if n in CLASS_NAMES})
+    keep = ~has_exception & cls.map(bool) & ~masque_exclusion(data, id_col, nom_k, prenom_k, exclusions)
+
+    id_s, nom_s, prenom_s, tel_s = (colonne_texte(data, c) for c in (id_col, nom_col, prenom_col, tel_col))
+    ordre = ordre[keep.loc[ordre].to_numpy()]
+
+    cols = [s.loc[ordre] for s in (id_s, nom_s, prenom_s, tel_s)]
+    classes_to_students: Dict[int, list] = defaultdict(list)
+    for row_cls, id_v, nom_v, prenom_v, tel_v in zip(cls.loc[ordre], *cols):
+        for c in row_cls:
+            classes_to_students[c].append((id_v, nom_v, prenom_v, tel_v))
+    return classes_to_students
 
 # ============================= ANALYSE =============================
 def analyser_groupes(groupes_str: Any) -> str:
@@ -287,6 +441,16 @@ with st.sidebar:
     st.caption("Auto-détection, mais tu peux forcer plus bas dans chaque onglet.")
     export_semicolon = st.checkbox("CSV erreurs avec point-virgule (;)", value=True)
     st.caption("Encodage UTF-8-SIG pour Excel FR.")
+    st.markdown("---")
+    st.header("🚫 Exclusions (Excel/PDF)")
+    exclusions_text = st.text_area("Une par ligne : Nom;Prénom ou ID", value=lire_exclusions_defaut(), height=120)
+    EXCLUSIONS = charger_exclusions(exclusions_text)
+    st.caption(f"{len(EXCLUSIONS[0])} nom(s) et {len(EXCLUSIONS[1])} ID(s) reconnus. "
+               "Une ligne sans « ; » est lue comme un ID.")
+    if EXCLUSIONS[1]:
+        ids_affiches = sorted(EXCLUSIONS[1])
+        st.caption("IDs : " + ", ".join(ids_affiches[:10]) + (" …" if len(ids_affiches) > 10 else ""))
+    st.caption("Sans accent ni casse. Valeur par défaut lue depuis exclusions.txt s'il existe.")
 
 uploaded = st.file_uploader("Dépose un fichier Excel (.xlsx, .xls)", type=["xlsx", "xls"])
 if not uploaded:
@@ -331,6 +495,14 @@ data.columns = headers
 GROUPES_COL_NAME = "Groupes (détecté I3/auto)"
 data[GROUPES_COL_NAME] = raw.iloc[start_row_idx:, groupes_col_idx].reset_index(drop=True)
 
+# Clés Nom/Prénom normalisées : une fois par fichier chargé (empreinte des octets + découpage)
+UPLOAD_KEY = f"{hashlib.sha256(uploaded.getvalue()).hexdigest()}|{sheet_name}|{start_row_idx}|{groupes_col_idx}"
+
+def cles_colonne(col: Optional[str]) -> Optional[pd.Series]:
+    if not col or col not in data.columns:
+        return None
+    return cles_normalisees(UPLOAD_KEY, col, data[col])
+
 # Sanity
 digits4 = data[GROUPES_COL_NAME].astype(str).str.count(r"\d{4,}").sum()
 if digits4 == 0:
@@ -348,21 +520,26 @@ tab_verif, tab_xlsx, tab_pdf = st.tabs(["✅ Vérification", "📄 Listes Excel
 with tab_verif:
     st.subheader("Paramètres colonnes (Vérification)")
     nom_guess, prenom_guess = autodetect_name_columns(list(data.columns))
+    id_guess_v = autodetect_id_column(list(data.columns))
 
     def _sel_index(options, guess):
         return options.index(guess) if guess in options else 0
 
     options_cols = ["—"] + list(data.columns)
 
-    col1, col2 = st.columns(2)
+    col1, col2, col3 = st.columns(3)
     with col1:
         nom_col = st.selectbox("Colonne Nom", options=options_cols,
                                index=_sel_index(options_cols, nom_guess), key="nom_verif")
     with col2:
         prenom_col = st.selectbox("Colonne Prénom", options=options_cols,
                                   index=_sel_index(options_cols, prenom_guess), key="prenom_verif")
+    with col3:
+        id_col = st.selectbox("Colonne ID", options=options_cols,
+                              index=_sel_index(options_cols, id_guess_v), key="id_verif")
     nom_col = None if nom_col == "—" else nom_col
     prenom_col = None if prenom_col == "—" else prenom_col
+    id_col = None if id_col == "—" else id_col
     if not nom_col or not prenom_col:
         st.warning("⚠️ Choisis/valide les colonnes **Nom** et **Prénom** pour un export d'erreurs correct.")
 
@@ -372,6 +549,14 @@ with tab_verif:
     extras = df[GROUPES_COL_NAME].apply(extra_info).apply(pd.Series)
     df = pd.concat([df, extras], axis=1)
 
+    # Doublons (même ID ou même Nom/Prénom normalisés) : remplace "OK" ; sinon visible dans la colonne Doublon
+    df["Doublon"] = detecter_doublons(df, GROUPES_COL_NAME, id_col, cles_colonne(nom_col), cles_colonne(prenom_col))
+    doublon_mask = df["Doublon"] != ""
+    df.loc[doublon_mask & (df["Diagnostic"] == "OK"), "Diagnostic"] = df["Doublon"]
+    if doublon_mask.any():
+        n_conflits = int((df["Doublon"] == DIAG_DOUBLON_CONFLIT).sum())
+        st.warning(f"⚠️ {int(doublon_mask.sum())} ligne(s) en doublon, dont {n_conflits} avec des classes différentes.")
+
     # Répartition
     counts = df["Diagnostic"].value_counts().sort_index()
     total = int(len(df))
@@ -384,8 +569,8 @@ with tab_verif:
     st.dataframe(rep_df, width="stretch")
 
     # Tableau
-    base_cols = [c for c in df.columns if c not in [GROUPES_COL_NAME, "Diagnostic", "FiliereDéduite", "ClasseDéduite", "NumerosTrouvés", "NumerosConnus", "NumerosInconnus"]]
-    display_cols = base_cols + [GROUPES_COL_NAME, "Diagnostic"]
+    base_cols = [c for c in df.columns if c not in [GROUPES_COL_NAME, "Diagnostic", "Doublon", "FiliereDéduite", "ClasseDéduite", "NumerosTrouvés", "NumerosConnus", "NumerosInconnus"]]
+    display_cols = base_cols + [GROUPES_COL_NAME, "Diagnostic", "Doublon"]
     if st.checkbox("Afficher colonnes techniques", value=False, key="tech_verif"):
         display_cols += ["FiliereDéduite", "ClasseDéduite", "NumerosTrouvés", "NumerosConnus", "NumerosInconnus"]
     st.markdown("### Données vérifiées")
@@ -396,7 +581,7 @@ with tab_verif:
     json_bytes = json.dumps(records, ensure_ascii=False, indent=2).encode("utf-8")
     st.download_button("⬇️ Télécharger JSON (complet)", data=json_bytes, file_name="export_verifie.json", mime="application/json", key="json_verif")
 
-    # Export erreurs (Nom, Prénom, Diagnostic) — CSV 3 colonnes
+    # Export erreurs (Nom, Prénom, Diagnostic, Doublon) — CSV 4 colonnes
     erreurs = df[df["Diagnostic"] != "OK"].copy()
 
     def safe_col(s: pd.Series) -> pd.Series:
@@ -420,10 +605,11 @@ with tab_verif:
             "Nom": safe_col(erreurs[nom_for_export]),
             "Prénom": safe_col(erreurs[prenom_for_export]),
             "Diagnostic": safe_col(erreurs["Diagnostic"]),
+            "Doublon": safe_col(erreurs["Doublon"]),
         })
         csv_text = export_df.to_csv(index=False, sep=sep)
         csv_bytes = csv_text.encode("utf-8-sig")
-        st.download_button("⬇️ Télécharger uniquement les erreurs (CSV) — 3 colonnes", data=csv_bytes,
+        st.download_button("⬇️ Télécharger uniquement les erreurs (CSV) — 4 colonnes", data=csv_bytes,
                            file_name="erreurs_groupes.csv", mime="text/csv", key="csv_erreurs")
 
 # =========================
@@ -461,28 +647,12 @@ with tab_xlsx:
     st.dataframe(data.head(10), width="stretch")
 
     # Préparer : classes -> étudiants (ID, Nom, Prénom, Téléphone + Remarque)
-    classes_to_students: Dict[int, list] = defaultdict(list)
-
-    def classes_for_row(nums: List[int]) -> Set[int]:
-        return {n for n in nums if n in CLASS_NAMES}
-
-    for _, row in data.iterrows():
-        nums = parse_numeros(row.get(GROUPES_COL_NAME))
-        if any(n in EXCEPTION_OK_IF_CLASS_ONLY for n in nums):
-            continue
-        cls = classes_for_row(nums)
-        if not cls:
-            continue
-        nom_v = "" if not nom_col_x else str(row.get(nom_col_x, "") or "")
-        prenom_v = "" if not prenom_col_x else str(row.get(prenom_col_x, "") or "")
-        tel_v = "" if not tel_col_x else str(row.get(tel_col_x, "") or "")
-        id_v = "" if not id_col_x else str(row.get(id_col_x, "") or "")
-
-        if is_salome_galbois(nom_v, prenom_v):
-            continue
-
-        for c in cls:
-            classes_to_students[c].append((id_v, nom_v, prenom_v, tel_v))
+    if EXCLUSIONS[1] and not id_col_x:
+        st.warning("⚠️ Des exclusions par ID sont définies mais aucune **Colonne ID** n'est sélectionnée : elles sont ignorées.")
+    classes_to_students = construire_classes(data, GROUPES_COL_NAME, id_col_x, nom_col_x,
+                                             prenom_col_x, tel_col_x,
+                                             cles_colonne(nom_col_x), cles_colonne(prenom_col_x),
+                                             ordre_collation(UPLOAD_KEY, nom_col_x, prenom_col_x, data), EXCLUSIONS)
 
     def sanitize_sheet_name(name: str) -> str:
         safe = "".join(ch for ch in name if ch not in '[]:*?/\\').strip()
@@ -558,8 +728,7 @@ with tab_xlsx:
                     for ccode in sorted(classes_to_students.keys(), key=lambda c: CLASS_NAMES.get(c, str(c))):
                         label = CLASS_NAMES.get(ccode, f"Classe {ccode}")
                         sheet = sanitize_sheet_name(label)
-                        rows_sorted = sorted(classes_to_students[ccode], key=lambda t: ((t[1] or "").lower(), (t[2] or "").lower()))
-                        df_sheet = pd.DataFrame(rows_sorted, columns=["ID", "Nom", "Prénom", "Téléphone"])
+                        df_sheet = pd.DataFrame(classes_to_students[ccode], columns=["ID", "Nom", "Prénom", "Téléphone"])
                         df_sheet["Remarque"] = ""
                         df_sheet.to_excel(writer, sheet_name=sheet, index=False)
                         if EXCEL_ENGINE == "xlsxwriter":
@@ -608,28 +777,12 @@ with tab_pdf:
         id_col_p = None if id_col_p == "—" else id_col_p
 
         # Construire classes->étudiants (mêmes règles d’exclusion)
-        classes_to_students_pdf: Dict[int, list] = defaultdict(list)
-
-        def classes_for_row(nums: List[int]) -> Set[int]:
-            return {n for n in nums if n in CLASS_NAMES}
-
-        for _, row in data.iterrows():
-            nums = parse_numeros(row.get(GROUPES_COL_NAME))
-            if any(n in EXCEPTION_OK_IF_CLASS_ONLY for n in nums):
-                continue
-            cls = classes_for_row(nums)
-            if not cls:
-                continue
-            nom_v = "" if not nom_col_p else str(row.get(nom_col_p, "") or "")
-            prenom_v = "" if not prenom_col_p else str(row.get(prenom_col_p, "") or "")
-            tel_v = "" if not tel_col_p else str(row.get(tel_col_p, "") or "")
-            id_v = "" if not id_col_p else str(row.get(id_col_p, "") or "")
-
-            if is_salome_galbois(nom_v, prenom_v):
-                continue
-
-            for c in cls:
-                classes_to_students_pdf[c].append((id_v, nom_v, prenom_v, tel_v))
+        if EXCLUSIONS[1] and not id_col_p:
+            st.warning("⚠️ Des exclusions par ID sont définies mais aucune **Colonne ID** n'est sélectionnée : elles sont ignorées.")
+        classes_to_students_pdf = construire_classes(data, GROUPES_COL_NAME, id_col_p, nom_col_p,
+                                                     prenom_col_p, tel_col_p,
+                                                     cles_colonne(nom_col_p), cles_colonne(prenom_col_p),
+                                                     ordre_collation(UPLOAD_KEY, nom_col_p, prenom_col_p, data), EXCLUSIONS)
 
         st.markdown("#### Aperçu PDF (10 lignes du dataset source)")
         st.dataframe(data.head(10), width="stretch")
@@ -660,8 +813,7 @@ with tab_pdf:
                 elements.append(Spacer(1, 4))
 
                 data_tbl = [["ID", "Nom", "Prénom", "Téléphone", "Remarque"]]
-                rows_sorted = sorted(classes_map[ccode], key=lambda t: ((t[1] or "").lower(), (t[2] or "").lower()))
-                for id_v, nom_v, prenom_v, tel_v in rows_sorted:
+                for id_v, nom_v, prenom_v, tel_v in classes_map[ccode]:
                     data_tbl.append([id_v, nom_v, prenom_v, tel_v, ""])
 
                 col_widths = [18*mm, 45*mm, 45*mm, 30*mm, 42*mm]